@@ -1,9 +1,15 @@
 """
 Clinical Report Data Extractor
 """
+import hashlib
+import heapq
+import operator
+import os
 import re
 import PyPDF2
 import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Any
 import utils
 from vector_db import CodeVectorDB
@@ -17,6 +23,225 @@ except ImportError:
     GEMINI_AVAILABLE = False
     print("[WARNING] google-generativeai not installed. Install with: pip install google-generativeai")
 
+# Optional PyMuPDF backend: MuPDF's C text extraction is 5-30x faster than
+# PyPDF2's pure-Python implementation
+try:
+    import fitz
+    FITZ_AVAILABLE = True
+except ImportError:
+    FITZ_AVAILABLE = False
+
+# Optional Aho-Corasick matcher: scans all literal phrases in one O(N) pass
+# instead of one substring search per phrase
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Precompiled patterns (compiling per call would hit re's cache lookup on
+# every extraction and recompile on cache misses)
+# All labeled patient fields fused into one alternation: a single finditer
+# pass over the report dispatches on lastgroup instead of ~10 full scans
+_PATIENT_MASTER_RE = re.compile(
+    r'(?:patient\s*id|patientid|medical record number|mrn|id)[:\s]+(?P<patient_id>[A-Z0-9\-]+)'
+    r'|(?:patient name|name)[:\s]+(?P<name>(?-i:[A-Z][a-z]+(?:,?[ \t][A-Z][a-z]+){1,3}))'
+    r'|(?:dob|date of birth|birth date)[:\s]+(?P<date_of_birth>\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})'
+    r'|age[:\s]+(?P<age>\d+)'
+    r'|(?:gender|sex)[:\s]+(?P<gender>[MF]|Male|Female)'
+    r'|(?:visit date|date of service|dos|date)[:\s]+(?P<visit_date>\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
+    re.IGNORECASE)
+# Unlabeled date fallback, only run for fields the labeled pass didn't fill.
+# There is deliberately no unlabeled name fallback: "any two capitalized
+# words" matched headers and physician names more often than patients.
+_BARE_DATE_RE = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
+_ICD_CODE_RE = re.compile(r'\b([A-Z]\d{2}(?:\.\d{1,4})?)\b')
+_CPT_CODE_RE = re.compile(r'\b(\d{5})\b')
+_DIGIT_RE = re.compile(r'\d')
+# HCPCS first letters baked into the character class so the regex engine
+# does the filtering (I/F/N/O/U/W-Z etc. never start HCPCS codes)
+_HCPCS_RE = re.compile(r'\b([ABCDEGHJKLMPQRSTV]\d{4})\b')
+_IMPRESSION_RE = re.compile(r'impression[:\s]+(.+?)(?=\n\n|plan:|$)', re.IGNORECASE | re.DOTALL)
+# Single alternations (longest phrase first) so the engine scans the report
+# once instead of once per pattern
+_CLINICAL_TERMS_RE = re.compile(
+    r'\b(sigmoid diverticulosis|colon polyps|no polyps?|polyps? found|polyps? revealed|'
+    r'internal hemorrhoids?|hemorrhoids?|diverticulosis|diverticulitis|melanosis coli|'
+    r'rectal (?:exam(?:ination)?|erosion|proctitis)|bowel preparation|preparation|'
+    r'no complications|complications|colonoscopy|colonoscope|polyps?)\b',
+    re.IGNORECASE)
+_ANATOMICAL_RE = re.compile(
+    r'\b(distal rectum|proximal colon|sigmoid colon|ileocecal valve|'
+    r'appendiceal orifice|appendix orifice|anal verge|rectum|rectal|sigmoid|'
+    r'cecum|caecum|colonic|colon)\b')
+_ANATOMY_CANONICAL = {'rectal': 'Rectum', 'colonic': 'Colon', 'sigmoid': 'Sigmoid colon'}
+
+# Gemini response post-processing: compiled once instead of inside the
+# per-call (and per-failure) paths
+_MD_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+_JSON_BRACE_RE = re.compile(r'\{.*\}', re.DOTALL)
+_GEMINI_RESULT_KEYS = ("ICD-10", "CPT", "HCPCS", "Clinical_Terms",
+                       "Anatomical_Locations", "Diagnosis", "Procedures")
+_GEMINI_CODE_KEYS = ("ICD-10", "CPT", "HCPCS")
+
+def _list_or_empty(value):
+    return value if isinstance(value, list) else []
+
+def _clean_gemini_result(result: Dict) -> Dict:
+    """Normalize a parsed Gemini response: every key a list, codes deduplicated"""
+    cleaned = {key: _list_or_empty(result.get(key)) for key in _GEMINI_RESULT_KEYS}
+    for key in _GEMINI_CODE_KEYS:
+        cleaned[key] = list({str(c).strip() for c in cleaned[key] if c})
+    return cleaned
+
+# Gemini response cache: identical report text + model + prompt version hit
+# the on-disk JSON cache (plus a small in-memory LRU) instead of the API.
+# Bump _PROMPT_VERSION whenever the extraction prompt changes.
+_PROMPT_VERSION = '1'
+_GEMINI_TEMPERATURE = 0.1
+_GEMINI_CACHE_MAX = 256
+_gemini_memory_cache = OrderedDict()
+
+def _gemini_cache_key(text_for_extraction: str) -> str:
+    payload = "\x00".join((config.GEMINI_MODEL, str(_GEMINI_TEMPERATURE),
+                           _PROMPT_VERSION, text_for_extraction))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _gemini_cache_get(key: str):
+    if key in _gemini_memory_cache:
+        _gemini_memory_cache.move_to_end(key)
+        return _gemini_memory_cache[key]
+    path = os.path.join(config.CACHE_DIR, 'gemini', key + '.json')
+    if os.path.exists(path):
+        try:
+            result = utils.load_json(path)
+        except Exception:
+            return None
+        _gemini_cache_remember(key, result)
+        return result
+    return None
+
+def _gemini_cache_remember(key: str, result: Dict):
+    _gemini_memory_cache[key] = result
+    _gemini_memory_cache.move_to_end(key)
+    while len(_gemini_memory_cache) > _GEMINI_CACHE_MAX:
+        _gemini_memory_cache.popitem(last=False)
+
+def _gemini_cache_put(key: str, result: Dict):
+    _gemini_cache_remember(key, result)
+    cache_dir = os.path.join(config.CACHE_DIR, 'gemini')
+    os.makedirs(cache_dir, exist_ok=True)
+    utils.save_json(result, os.path.join(cache_dir, key + '.json'))
+
+def _make_matcher(mapping):
+    """Build a lowercase-phrase -> canonical-term matcher"""
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for phrase, canonical in mapping.items():
+            automaton.add_word(phrase, canonical)
+        automaton.make_automaton()
+        return automaton
+    return mapping
+
+def _scan_phrases(matcher, text_lc):
+    """Return the canonical terms whose phrases occur in the lowercased text"""
+    if AHOCORASICK_AVAILABLE:
+        return {canonical for _, canonical in matcher.iter(text_lc)}
+    return {canonical for phrase, canonical in matcher.items() if phrase in text_lc}
+
+def _make_word_matcher(phrases):
+    """Build an Aho-Corasick automaton over literal term variants
+
+    Returns None when pyahocorasick is missing; callers then stay on the
+    fused-regex path.
+    """
+    if not AHOCORASICK_AVAILABLE:
+        return None
+    automaton = ahocorasick.Automaton()
+    for phrase in phrases:
+        automaton.add_word(phrase, phrase)
+    automaton.make_automaton()
+    return automaton
+
+def _scan_words(automaton, text_lc):
+    """Leftmost-longest, word-bounded matches from one automaton pass
+
+    The automaton reports every occurrence, including substrings; this
+    filter keeps matches flanked by non-word characters and drops ones
+    contained in a longer hit, mirroring the \\b-anchored alternation
+    semantics of the regex fallback while scanning in O(|text| + matches)
+    regardless of dictionary size.
+    """
+    hits = []
+    for end, phrase in automaton.iter(text_lc):
+        start = end - len(phrase) + 1
+        if start > 0 and (text_lc[start - 1].isalnum() or text_lc[start - 1] == '_'):
+            continue
+        if end + 1 < len(text_lc) and (text_lc[end + 1].isalnum() or text_lc[end + 1] == '_'):
+            continue
+        hits.append((start, end + 1, phrase))
+    hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+    found = set()
+    last_end = 0
+    for start, end, phrase in hits:
+        if start >= last_end:
+            found.add(phrase)
+            last_end = end
+    return found
+
+_IMPRESSION_TERMS = _make_matcher({p: p for p in (
+    'colon polyps', 'history of colon polyps', 'colonic polyps',
+    'internal hemorrhoids', 'hemorrhoids',
+    'diverticulosis', 'sigmoid diverticulosis',
+    'melanosis coli', 'no polyps', 'rectal erosion',
+    'good bowel preparation', 'no complications',
+)})
+_DIAGNOSIS_IMPRESSION_TERMS = _make_matcher({p.lower(): p for p in (
+    'Personal history of colonic polyps',
+    'Internal hemorrhoids',
+    'Diverticulosis',
+    'Melanosis coli',
+    'No new polyps',
+    'No polyps seen',
+)})
+_DIAGNOSIS_TEXT_TERMS = _make_matcher({
+    '82-year-old female with history of colon polyps': 'Personal history of colonic polyps',
+    'diverticulosis': 'Diverticulosis (sigmoid)',
+    'melanosis coli': 'Melanosis coli',
+    'internal hemorrhoids': 'Internal hemorrhoids',
+    'no polyps': 'No new polyps seen in this examination',
+})
+_PROCEDURE_TERMS = _make_matcher({
+    'colonoscopy': 'Colonoscopy',
+    'rectal exam': 'Rectal examination',
+    'rectal examination': 'Rectal examination',
+    'scope passage': 'Scope passage to cecum',
+    'colonoscope': 'Scope passage to cecum',
+    'retroflexion': 'Retroflexion in rectum',
+    'monitored anesthesia care': 'Monitored Anesthesia Care (MAC)',
+    'mac': 'Monitored Anesthesia Care (MAC)',
+    'intravenous': "Intravenous medication administration (Lidocaine, Propofol, Lactated Ringer's)",
+    'iv': "Intravenous medication administration (Lidocaine, Propofol, Lactated Ringer's)",
+})
+
+# Literal expansions of the clinical-term and anatomy alternations: with
+# pyahocorasick installed the extract methods scan these in one automaton
+# pass; otherwise they fall back to the fused regexes above
+_CLINICAL_TERM_LITERALS = _make_word_matcher((
+    'sigmoid diverticulosis', 'colon polyps', 'no polyp', 'no polyps',
+    'polyp found', 'polyps found', 'polyp revealed', 'polyps revealed',
+    'internal hemorrhoid', 'internal hemorrhoids', 'hemorrhoid', 'hemorrhoids',
+    'diverticulosis', 'diverticulitis', 'melanosis coli',
+    'rectal exam', 'rectal examination', 'rectal erosion', 'rectal proctitis',
+    'bowel preparation', 'preparation', 'no complications', 'complications',
+    'colonoscopy', 'colonoscope', 'polyp', 'polyps',
+))
+_ANATOMY_LITERALS = _make_word_matcher((
+    'distal rectum', 'proximal colon', 'sigmoid colon', 'ileocecal valve',
+    'appendiceal orifice', 'appendix orifice', 'anal verge', 'rectum',
+    'rectal', 'sigmoid', 'cecum', 'caecum', 'colonic', 'colon',
+))
+
 class ClinicalReportExtractor:
     """Extract structured data from clinical reports"""
     
@@ -51,15 +276,25 @@ class ClinicalReportExtractor:
     
     def extract_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF file"""
-        text = ""
+        if FITZ_AVAILABLE:
+            try:
+                with fitz.open(pdf_path) as doc:
+                    return "\n".join(page.get_text("text") for page in doc) + "\n"
+            except Exception as e:
+                print(f"Error reading PDF {pdf_path} with PyMuPDF: {e}")
+                print("[INFO] Falling back to PyPDF2")
+
+        # Collect pages and join once; += in the loop reallocates the whole
+        # string per page (quadratic on large PDFs)
+        parts = []
         try:
             with open(pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+                    parts.append(page.extract_text() or "")
         except Exception as e:
             print(f"Error reading PDF {pdf_path}: {e}")
-        return text
+        return "\n".join(parts) + "\n" if parts else ""
     
     def extract_patient_info(self, text: str) -> Dict[str, Any]:
         """Extract patient information from clinical report"""
@@ -72,187 +307,91 @@ class ClinicalReportExtractor:
             'visit_date': None
         }
         
-        # Extract patient ID
-        patient_id_patterns = [
-            r'(?:patient id|patientid|mrn|medical record number)[:\s]+([A-Z0-9\-]+)',
-            r'(?:id|mrn)[:\s]+([A-Z0-9\-]+)'
-        ]
-        for pattern in patient_id_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                patient_info['patient_id'] = match.group(1).strip()
-                break
-        
-        # Extract name
-        name_patterns = [
-            r'(?:patient name|name)[:\s]+([A-Z][a-z]+ [A-Z][a-z]+)',
-            r'([A-Z][a-z]+,?\s+[A-Z][a-z]+)',  # Last, First format
-        ]
-        for pattern in name_patterns:
-            match = re.search(pattern, text)
-            if match:
-                patient_info['name'] = match.group(1).strip()
-                break
-        
-        # Extract DOB
-        dob_patterns = [
-            r'(?:dob|date of birth|birth date)[:\s]+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
-            r'(\d{1,2}/\d{1,2}/\d{4})'
-        ]
-        for pattern in dob_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                patient_info['date_of_birth'] = match.group(1).strip()
-                break
-        
-        # Extract age
-        age_match = re.search(r'(?:age)[:\s]+(\d+)', text, re.IGNORECASE)
-        if age_match:
-            patient_info['age'] = int(age_match.group(1))
-        
-        # Extract gender
-        gender_match = re.search(r'(?:gender|sex)[:\s]+([MF]|Male|Female)', text, re.IGNORECASE)
-        if gender_match:
-            patient_info['gender'] = gender_match.group(1).strip()
-        
-        # Extract visit date
-        visit_date_patterns = [
-            r'(?:visit date|date of service|dos|date)[:\s]+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
-            r'(\d{1,2}/\d{1,2}/\d{4})'
-        ]
-        for pattern in visit_date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        # Single pass over the report: each match fills the first occurrence
+        # of the field named by lastgroup
+        remaining = len(patient_info)
+        for match in _PATIENT_MASTER_RE.finditer(text):
+            field = match.lastgroup
+            if patient_info[field] is None:
+                value = match.group(field).strip()
+                patient_info[field] = int(value) if field == 'age' else value
+                remaining -= 1
+                if remaining == 0:
+                    break
+
+        # Unlabeled date fallback for anything the labeled pass missed
+        if patient_info['date_of_birth'] is None or patient_info['visit_date'] is None:
+            match = _BARE_DATE_RE.search(text)
             if match:
-                patient_info['visit_date'] = match.group(1).strip()
-                break
-        
+                date = match.group(1).strip()
+                if patient_info['date_of_birth'] is None:
+                    patient_info['date_of_birth'] = date
+                if patient_info['visit_date'] is None:
+                    patient_info['visit_date'] = date
+
         return patient_info
     
-    def extract_icd_codes(self, text: str) -> List[Dict[str, Any]]:
-        """Extract ICD codes using NLP and vector database"""
-        # Extract entities first
-        entities = utils.extract_clinical_entities(text)
-        
-        # Extract sections for context
-        sections = utils.extract_sections(text)
-        
-        # Combine relevant sections for diagnosis search
-        diagnosis_context = " ".join([
-            sections.get('chief_complaint', ''),
-            sections.get('history_of_present_illness', ''),
-            sections.get('assessment_and_plan', ''),
-            sections.get('diagnoses', '')
-        ])
-        
-        # Search for ICD codes
-        icd_results = self.vector_db.search_icd(
-            diagnosis_context if diagnosis_context.strip() else text,
-            top_k=config.TOP_K_RESULTS,
-            threshold=config.SIMILARITY_THRESHOLD
-        )
-        
-        # Also check for explicit ICD codes in text (improved pattern to catch codes like K64.8, K57.90)
-        explicit_codes = re.findall(r'\b([A-Z]\d{2}(?:\.\d{1,4})?)\b', text)
+    def _extract_codes(self, text: str, explicit_re, context_sections,
+                       search, search_batch, describe_miss,
+                       sections: Dict = None) -> List[Dict[str, Any]]:
+        """Shared skeleton for extract_icd_codes/extract_cpt_codes
+
+        Finds explicit codes in the text, enriches them through the vector
+        database (one batched encoder/search call instead of one per code),
+        merges in NLP-retrieved codes, then dedupes and keeps the top 10 by
+        confidence. Callers that already parsed the report can pass sections
+        to avoid re-running the section extractor.
+        """
+        # First, prioritize explicit codes found in text; look them all up in
+        # one batched call (lower threshold for explicit codes). Both code
+        # formats contain digits, so a one-char prefilter skips the full
+        # findall scan over digit-free (form-heavy) reports.
+        if _DIGIT_RE.search(text):
+            explicit_codes = list(dict.fromkeys(
+                c.strip() for c in explicit_re.findall(text) if c.strip()
+            ))
+        else:
+            explicit_codes = []
         extracted_codes = []
-        explicit_codes_found = set()
-        
-        # First, prioritize explicit codes found in text
-        for code in explicit_codes:
-            code = code.strip()
-            if code and code not in explicit_codes_found:
-                explicit_codes_found.add(code)
-                # Search for this specific code (lower threshold for explicit codes)
-                code_matches = self.vector_db.search_icd(code, top_k=1, threshold=0.1)
-                if code_matches:
-                    extracted_codes.append({
-                        'code': code,
-                        'description': code_matches[0]['description'],
-                        'confidence': 1.0,  # High confidence for explicit codes
-                        'source': 'explicit_code'
-                    })
-                else:
-                    # Even if not in database, include it if it matches ICD-10 pattern
-                    if re.match(r'^[A-Z]\d{2}(\.\d{1,4})?$', code):
-                        extracted_codes.append({
-                            'code': code,
-                            'description': code,  # Use code as description if not found
-                            'confidence': 0.95,
-                            'source': 'explicit_code'
-                        })
-        
-        # Then add NLP-retrieved codes that aren't already in the list
-        for result in icd_results:
-            if result['code'] not in explicit_codes_found:
+        batch_matches = search_batch(explicit_codes, top_k=1, threshold=0.1) if explicit_codes else []
+        for code, code_matches in zip(explicit_codes, batch_matches):
+            if code_matches:
                 extracted_codes.append({
-                    'code': result['code'],
-                    'description': result['description'],
-                    'confidence': result['similarity_score'],
-                    'source': 'nlp_retrieval'
+                    'code': code,
+                    'description': code_matches[0]['description'],
+                    'confidence': 1.0,  # High confidence for explicit codes
+                    'source': 'explicit_code'
                 })
-        
-        # Remove duplicates and sort by confidence
-        seen_codes = set()
-        unique_codes = []
-        for code_info in sorted(extracted_codes, key=lambda x: x['confidence'], reverse=True):
-            if code_info['code'] not in seen_codes:
-                seen_codes.add(code_info['code'])
-                unique_codes.append(code_info)
-        
-        return unique_codes[:10]  # Return top 10
-    
-    def extract_cpt_codes(self, text: str) -> List[Dict[str, Any]]:
-        """Extract CPT codes using NLP and vector database"""
-        # Extract entities first
-        entities = utils.extract_clinical_entities(text)
-        
-        # Extract sections for context
-        sections = utils.extract_sections(text)
-        
-        # Combine relevant sections for procedure search
-        procedure_context = " ".join([
-            sections.get('procedures', ''),
-            sections.get('physical_examination', ''),
-            sections.get('assessment_and_plan', '')
-        ])
-        
-        # Search for CPT codes
-        cpt_results = self.vector_db.search_cpt(
-            procedure_context if procedure_context.strip() else text,
-            top_k=config.TOP_K_RESULTS,
-            threshold=config.SIMILARITY_THRESHOLD
-        )
-        
-        # Also check for explicit CPT codes in text (5-digit codes)
-        # Look for "Procedure Codes : 45380" or "45378" patterns
-        explicit_codes = re.findall(r'\b(\d{5})\b', text)
-        extracted_codes = []
-        explicit_codes_found = set()
-        
-        # First, prioritize explicit codes found in text
-        for code in explicit_codes:
-            code = code.strip()
-            if code and code not in explicit_codes_found:
-                explicit_codes_found.add(code)
-                # Search for this specific code (lower threshold for explicit codes)
-                code_matches = self.vector_db.search_cpt(code, top_k=1, threshold=0.1)
-                if code_matches:
-                    extracted_codes.append({
-                        'code': code,
-                        'description': code_matches[0]['description'],
-                        'confidence': 1.0,  # High confidence for explicit codes
-                        'source': 'explicit_code'
-                    })
-                else:
-                    # Even if not in database, include it if it's a 5-digit code
+            else:
+                # Not in the database; include it if the format still looks valid
+                description = describe_miss(code)
+                if description is not None:
                     extracted_codes.append({
                         'code': code,
-                        'description': f'CPT Code {code}',
+                        'description': description,
                         'confidence': 0.95,
                         'source': 'explicit_code'
                     })
-        
+
+        # NLP retrieval over the relevant sections (whole report as fallback).
+        # Only 10 codes survive the final cut, so when explicit matches alone
+        # already fill it, skip the encoder pass entirely — on well-coded
+        # reports that is the single most expensive step in the pipeline.
+        if len(extracted_codes) >= 10:
+            nlp_results = []
+        else:
+            if sections is None:
+                sections = utils.extract_sections(text)
+            context = " ".join(sections.get(name, '') for name in context_sections)
+            nlp_results = search(
+                context if context.strip() else text,
+                top_k=config.TOP_K_RESULTS,
+                threshold=config.SIMILARITY_THRESHOLD
+            )
+
         # Then add NLP-retrieved codes that aren't already in the list
-        for result in cpt_results:
+        explicit_codes_found = set(explicit_codes)
+        for result in nlp_results:
             if result['code'] not in explicit_codes_found:
                 extracted_codes.append({
                     'code': result['code'],
@@ -260,58 +399,52 @@ class ClinicalReportExtractor:
                     'confidence': result['similarity_score'],
                     'source': 'nlp_retrieval'
                 })
-        
-        # Remove duplicates and sort by confidence
-        seen_codes = set()
-        unique_codes = []
-        for code_info in sorted(extracted_codes, key=lambda x: x['confidence'], reverse=True):
-            if code_info['code'] not in seen_codes:
-                seen_codes.add(code_info['code'])
-                unique_codes.append(code_info)
-        
-        return unique_codes[:10]  # Return top 10
+
+        # Keep the best-confidence entry per code, then select the top 10 with
+        # a C-level partial sort instead of sorting every candidate
+        unique_codes = {}
+        for code_info in extracted_codes:
+            existing = unique_codes.get(code_info['code'])
+            if existing is None or code_info['confidence'] > existing['confidence']:
+                unique_codes[code_info['code']] = code_info
+
+        return heapq.nlargest(10, unique_codes.values(),
+                              key=operator.itemgetter('confidence'))
+
+    def extract_icd_codes(self, text: str, sections: Dict = None) -> List[Dict[str, Any]]:
+        """Extract ICD codes using NLP and vector database"""
+        return self._extract_codes(
+            text, _ICD_CODE_RE,
+            ('chief_complaint', 'history_of_present_illness', 'assessment_and_plan', 'diagnoses'),
+            self.vector_db.search_icd, self.vector_db.search_icd_batch,
+            # Codes from _ICD_CODE_RE are valid ICD-10 by construction, so the
+            # code itself serves as the description — no format re-check needed
+            lambda code: code,
+            sections=sections
+        )
+
+    def extract_cpt_codes(self, text: str, sections: Dict = None) -> List[Dict[str, Any]]:
+        """Extract CPT codes using NLP and vector database"""
+        return self._extract_codes(
+            text, _CPT_CODE_RE,
+            ('procedures', 'physical_examination', 'assessment_and_plan'),
+            self.vector_db.search_cpt, self.vector_db.search_cpt_batch,
+            lambda code: f'CPT Code {code}',
+            sections=sections
+        )
     
     def extract_clinical_terms(self, text: str) -> List[str]:
         """Extract clinical terms and conditions"""
-        terms = set()
-        
-        # Common clinical terms patterns
-        patterns = [
-            r'\b(colon polyps|polyps?)\b',
-            r'\b(internal hemorrhoids?|hemorrhoids?)\b',
-            r'\b(diverticulosis|diverticulitis)\b',
-            r'\b(melanosis coli)\b',
-            r'\b(rectal (exam|examination|erosion|proctitis))\b',
-            r'\b(bowel preparation|preparation)\b',
-            r'\b(no polyps?|polyps? found|polyps? revealed)\b',
-            r'\b(no complications|complications)\b',
-            r'\b(colonoscopy|colonoscope)\b',
-            r'\b(sigmoid diverticulosis)\b'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    terms.add(match[0].strip().lower())
-                else:
-                    terms.add(match.strip().lower())
-        
-        # Also extract from impressions and findings
-        impression_section = re.search(r'impression[:\s]+(.+?)(?=\n\n|plan:|$)', text, re.IGNORECASE | re.DOTALL)
+        if _CLINICAL_TERM_LITERALS is not None:
+            terms = _scan_words(_CLINICAL_TERM_LITERALS, text.lower())
+        else:
+            terms = {match.group(1).strip().lower()
+                     for match in _CLINICAL_TERMS_RE.finditer(text)}
+
+        # Also extract key phrases from impressions and findings
+        impression_section = _IMPRESSION_RE.search(text)
         if impression_section:
-            impression_text = impression_section.group(1).lower()
-            # Extract key phrases
-            key_phrases = [
-                'colon polyps', 'history of colon polyps', 'colonic polyps',
-                'internal hemorrhoids', 'hemorrhoids',
-                'diverticulosis', 'sigmoid diverticulosis',
-                'melanosis coli', 'no polyps', 'rectal erosion',
-                'good bowel preparation', 'no complications'
-            ]
-            for phrase in key_phrases:
-                if phrase in impression_text:
-                    terms.add(phrase)
+            terms |= _scan_phrases(_IMPRESSION_TERMS, impression_section.group(1).lower())
         
         # Clean up and format
         formatted_terms = []
@@ -324,45 +457,23 @@ class ClinicalReportExtractor:
         
         return formatted_terms
     
-    def extract_anatomical_locations(self, text: str) -> List[str]:
+    def extract_anatomical_locations(self, text: str, text_lc: str = None) -> List[str]:
         """Extract anatomical locations mentioned in the report"""
-        locations = set()
-        
-        # Common anatomical terms
-        anatomical_patterns = [
-            r'\b(rectum|rectal)\b',
-            r'\b(sigmoid (colon)?|sigmoid)\b',
-            r'\b(cecum|caecum)\b',
-            r'\b(proximal colon)\b',
-            r'\b(ileocecal valve)\b',
-            r'\b(appendiceal orifice|appendix orifice)\b',
-            r'\b(distal rectum)\b',
-            r'\b(anal verge)\b',
-            r'\b(colon|colonic)\b'
-        ]
-        
-        text_lower = text.lower()
-        for pattern in anatomical_patterns:
-            matches = re.findall(pattern, text_lower)
-            for match in matches:
-                if isinstance(match, tuple):
-                    loc = match[0].strip()
-                else:
-                    loc = match.strip()
-                if loc:
-                    # Clean up
-                    if loc == 'rectal':
-                        loc = 'Rectum'
-                    elif loc == 'colonic':
-                        loc = 'Colon'
-                    elif loc == 'sigmoid':
-                        loc = 'Sigmoid colon'
-                    locations.add(loc.capitalize())
-        
-        return sorted(list(locations))
+        if text_lc is None:
+            text_lc = text.lower()
+        if _ANATOMY_LITERALS is not None:
+            found = _scan_words(_ANATOMY_LITERALS, text_lc)
+        else:
+            found = {match.group(1) for match in _ANATOMICAL_RE.finditer(text_lc)}
+        locations = {_ANATOMY_CANONICAL.get(loc, loc.capitalize()) for loc in found}
+
+        return sorted(locations)
     
-    def extract_diagnosis_descriptions(self, text: str, icd_codes: List[Dict]) -> List[str]:
+    def extract_diagnosis_descriptions(self, text: str, icd_codes: List[Dict],
+                                       text_lc: str = None) -> List[str]:
         """Extract diagnosis descriptions"""
+        if text_lc is None:
+            text_lc = text.lower()
         diagnoses = set()
         
         # Get descriptions from ICD codes
@@ -371,84 +482,43 @@ class ClinicalReportExtractor:
             if desc:
                 diagnoses.add(desc)
         
-        # Extract from text
-        impression_match = re.search(r'impression[:\s]+(.+?)(?=\n\n|plan:|$)', text, re.IGNORECASE | re.DOTALL)
+        # Extract key diagnosis phrases from the impression section
+        impression_match = _IMPRESSION_RE.search(text)
         if impression_match:
-            impression_text = impression_match.group(1)
-            # Extract key diagnosis phrases
-            diagnosis_phrases = [
-                'Personal history of colonic polyps',
-                'Internal hemorrhoids',
-                'Diverticulosis',
-                'Melanosis coli',
-                'No new polyps',
-                'No polyps seen'
-            ]
-            for phrase in diagnosis_phrases:
-                if phrase.lower() in impression_text.lower():
-                    diagnoses.add(phrase)
-        
-        # Also check explicit mentions
-        if '82-year-old female with history of colon polyps' in text:
-            diagnoses.add('Personal history of colonic polyps')
-        if 'diverticulosis' in text.lower():
-            diagnoses.add('Diverticulosis (sigmoid)')
-        if 'melanosis coli' in text.lower():
-            diagnoses.add('Melanosis coli')
-        if 'internal hemorrhoids' in text.lower():
-            diagnoses.add('Internal hemorrhoids')
-        if 'no polyps' in text.lower():
-            diagnoses.add('No new polyps seen in this examination')
-        
-        return sorted(list(diagnoses))
+            diagnoses |= _scan_phrases(_DIAGNOSIS_IMPRESSION_TERMS,
+                                       impression_match.group(1).lower())
+
+        # Also check explicit mentions anywhere in the report
+        diagnoses |= _scan_phrases(_DIAGNOSIS_TEXT_TERMS, text_lc)
+
+        return sorted(diagnoses)
     
-    def extract_procedure_descriptions(self, text: str) -> List[str]:
+    def extract_procedure_descriptions(self, text: str, text_lc: str = None) -> List[str]:
         """Extract procedure descriptions"""
-        procedures = set()
-        
-        # Common procedures
-        if 'colonoscopy' in text.lower():
-            procedures.add('Colonoscopy')
-        if 'rectal exam' in text.lower() or 'rectal examination' in text.lower():
-            procedures.add('Rectal examination')
-        if 'scope passage' in text.lower() or 'colonoscope' in text.lower():
-            procedures.add('Scope passage to cecum')
-        if 'retroflexion' in text.lower():
-            procedures.add('Retroflexion in rectum')
-        if 'monitored anesthesia care' in text.lower() or 'mac' in text.lower():
-            procedures.add('Monitored Anesthesia Care (MAC)')
-        if 'intravenous' in text.lower() or 'iv' in text.lower():
-            procedures.add("Intravenous medication administration (Lidocaine, Propofol, Lactated Ringer's)")
-        
-        return sorted(list(procedures))
+        if text_lc is None:
+            text_lc = text.lower()
+        procedures = _scan_phrases(_PROCEDURE_TERMS, text_lc)
+        return sorted(procedures)
     
     def extract_hcpcs_codes(self, text: str) -> List[str]:
         """Extract HCPCS codes (alphanumeric codes like J3490, A4216)"""
-        hcpcs_codes = set()
-        
-        # HCPCS codes are typically alphanumeric: 1 letter followed by 4 digits
-        hcpcs_pattern = r'\b([A-Z]\d{4})\b'
-        matches = re.findall(hcpcs_pattern, text)
-        
-        for match in matches:
-            # Filter out ICD codes (which start with specific letters like I, E, K, Z)
-            # HCPCS typically start with A, B, C, D, E, G, H, J, K, L, M, P, Q, R, S, T, V
-            if match[0] in ['A', 'B', 'C', 'D', 'E', 'G', 'H', 'J', 'K', 'L', 'M', 'P', 'Q', 'R', 'S', 'T', 'V']:
-                hcpcs_codes.add(match)
-        
-        return sorted(list(hcpcs_codes))
+        # HCPCS codes are typically alphanumeric: 1 letter followed by 4 digits;
+        # the allowed first letters live in the regex character class
+        return sorted({m.group(1) for m in _HCPCS_RE.finditer(text)})
     
     def extract_from_report(self, text: str, report_id: str = None) -> Dict[str, Any]:
         """Extract all structured data from a clinical report"""
+        # Parse sections once and share them with the code extractors
+        sections = utils.extract_sections(text)
         result = {
             'report_id': report_id or 'unknown',
             'patient_info': self.extract_patient_info(text),
-            'icd_codes': self.extract_icd_codes(text),
-            'cpt_codes': self.extract_cpt_codes(text),
-            'sections': utils.extract_sections(text),
+            'icd_codes': self.extract_icd_codes(text, sections=sections),
+            'cpt_codes': self.extract_cpt_codes(text, sections=sections),
+            'sections': sections,
             'raw_text_length': len(text)
         }
-        
+
         return result
     
     def extract_codes_with_gemini(self, text: str) -> Dict[str, Any]:
@@ -456,7 +526,14 @@ class ClinicalReportExtractor:
         
         # Limit text length to avoid token limits (keep it under 30k chars)
         text_for_extraction = text[:30000] if len(text) > 30000 else text
-        
+
+        # Re-runs and duplicate reports skip the LLM call entirely
+        cache_key = _gemini_cache_key(text_for_extraction)
+        cached_result = _gemini_cache_get(cache_key)
+        if cached_result is not None:
+            print("[INFO] Gemini cache hit, skipping API call")
+            return cached_result
+
         prompt = f"""You are a medical coding expert. Extract all medical codes and structured data from the following clinical report.
 
 Extract the following information:
@@ -518,81 +595,51 @@ Clinical Report Text:
             response = self.gemini_model.generate_content(
                 prompt,
                 generation_config={
-                    "temperature": 0.1,  # Low temperature for consistent extraction
+                    "temperature": _GEMINI_TEMPERATURE,  # Low temperature for consistent extraction
                     "top_p": 0.95,
                     "top_k": 40,
                 }
             )
             
             result_text = response.text.strip()
-            
+
             # Clean up response (remove markdown code blocks if present)
-            if result_text.startswith('```json'):
-                result_text = result_text[7:].strip()
-            elif result_text.startswith('```'):
-                result_text = result_text[3:].strip()
-            if result_text.endswith('```'):
-                result_text = result_text[:-3].strip()
-            
+            result_text = _MD_FENCE_RE.sub('', result_text).strip()
+
             # Try to extract JSON if there's extra text
             json_start = result_text.find('{')
             json_end = result_text.rfind('}') + 1
             if json_start >= 0 and json_end > json_start:
                 result_text = result_text[json_start:json_end]
-            
+
             # Parse JSON response
             result = json.loads(result_text)
-            
+
             # Validate and clean up
             if not isinstance(result, dict):
                 print("[WARNING] Gemini returned invalid response format")
                 return {}
-            
-            # Ensure all keys exist with empty lists as defaults
-            cleaned_result = {
-                "ICD-10": result.get("ICD-10", []) if isinstance(result.get("ICD-10"), list) else [],
-                "CPT": result.get("CPT", []) if isinstance(result.get("CPT"), list) else [],
-                "HCPCS": result.get("HCPCS", []) if isinstance(result.get("HCPCS"), list) else [],
-                "Clinical_Terms": result.get("Clinical_Terms", []) if isinstance(result.get("Clinical_Terms"), list) else [],
-                "Anatomical_Locations": result.get("Anatomical_Locations", []) if isinstance(result.get("Anatomical_Locations"), list) else [],
-                "Diagnosis": result.get("Diagnosis", []) if isinstance(result.get("Diagnosis"), list) else [],
-                "Procedures": result.get("Procedures", []) if isinstance(result.get("Procedures"), list) else []
-            }
-            
-            # Clean and deduplicate codes
-            cleaned_result["ICD-10"] = list(set([str(c).strip() for c in cleaned_result["ICD-10"] if c]))
-            cleaned_result["CPT"] = list(set([str(c).strip() for c in cleaned_result["CPT"] if c]))
-            cleaned_result["HCPCS"] = list(set([str(c).strip() for c in cleaned_result["HCPCS"] if c]))
-            
+
+            cleaned_result = _clean_gemini_result(result)
+
             print(f"[INFO] Gemini extracted: {len(cleaned_result['ICD-10'])} ICD codes, {len(cleaned_result['CPT'])} CPT codes")
-            
+
+            _gemini_cache_put(cache_key, cleaned_result)
             return cleaned_result
-            
+
         except json.JSONDecodeError as e:
             print(f"[WARNING] Gemini API returned invalid JSON: {e}")
             print(f"[DEBUG] Response text: {result_text[:500]}")
             # Try to fix common JSON issues
             try:
                 # Try to extract just the JSON part more aggressively
-                import re as regex_module
-                json_pattern = regex_module.search(r'\{.*\}', result_text, regex_module.DOTALL)
+                json_pattern = _JSON_BRACE_RE.search(result_text)
                 if json_pattern:
-                    fixed_json = json_pattern.group(0)
-                    result = json.loads(fixed_json)
+                    result = json.loads(json_pattern.group(0))
                     if isinstance(result, dict):
-                        cleaned_result = {
-                            "ICD-10": result.get("ICD-10", []) if isinstance(result.get("ICD-10"), list) else [],
-                            "CPT": result.get("CPT", []) if isinstance(result.get("CPT"), list) else [],
-                            "HCPCS": result.get("HCPCS", []) if isinstance(result.get("HCPCS"), list) else [],
-                            "Clinical_Terms": result.get("Clinical_Terms", []) if isinstance(result.get("Clinical_Terms"), list) else [],
-                            "Anatomical_Locations": result.get("Anatomical_Locations", []) if isinstance(result.get("Anatomical_Locations"), list) else [],
-                            "Diagnosis": result.get("Diagnosis", []) if isinstance(result.get("Diagnosis"), list) else [],
-                            "Procedures": result.get("Procedures", []) if isinstance(result.get("Procedures"), list) else []
-                        }
-                        cleaned_result["ICD-10"] = list(set([str(c).strip() for c in cleaned_result["ICD-10"] if c]))
-                        cleaned_result["CPT"] = list(set([str(c).strip() for c in cleaned_result["CPT"] if c]))
-                        cleaned_result["HCPCS"] = list(set([str(c).strip() for c in cleaned_result["HCPCS"] if c]))
+                        cleaned_result = _clean_gemini_result(result)
                         print(f"[INFO] Gemini extracted (fixed): {len(cleaned_result['ICD-10'])} ICD codes, {len(cleaned_result['CPT'])} CPT codes")
+                        _gemini_cache_put(cache_key, cleaned_result)
                         return cleaned_result
             except:
                 pass
@@ -610,11 +657,14 @@ Clinical Report Text:
         diagnosis_descriptions = gemini_result.get("Diagnosis", [])
         
         # If diagnosis descriptions are empty, try to get from vector DB
+        # (one batched encoder/search call instead of one per code)
         if not diagnosis_descriptions:
             icd_codes = gemini_result.get("ICD-10", [])
             icd_code_list = []
-            for code in icd_codes:
-                matches = self.vector_db.search_icd(str(code), top_k=1, threshold=0.1)
+            batch_matches = (self.vector_db.search_icd_batch(
+                [str(code) for code in icd_codes], top_k=1, threshold=0.1)
+                if icd_codes else [])
+            for code, matches in zip(icd_codes, batch_matches):
                 if matches:
                     diagnosis_descriptions.append(matches[0]['description'])
                     icd_code_list.append({
@@ -656,7 +706,10 @@ Clinical Report Text:
                     print("[INFO] Gemini found no CPT codes, supplementing with regex search...")
                     regex_result = self.extract_to_required_format_regex(text)
                     if regex_result.get("CPT"):
-                        enhanced_result["CPT"] = list(set(enhanced_result.get("CPT", []) + regex_result.get("CPT", [])))
+                        # dict.fromkeys: one pass, and keeps Gemini-then-regex
+                        # order stable for downstream JSON diffing
+                        enhanced_result["CPT"] = list(dict.fromkeys(
+                            enhanced_result.get("CPT", []) + regex_result.get("CPT", [])))
                         print(f"[INFO] Added {len(regex_result.get('CPT', []))} CPT code(s) from regex")
                 
                 return enhanced_result
@@ -666,11 +719,33 @@ Clinical Report Text:
         # Fallback to regex-based extraction
         return self.extract_to_required_format_regex(text)
     
+    def extract_many(self, pdf_paths: List[str]) -> List[Dict[str, List[str]]]:
+        """Extract from a batch of PDFs in parallel, one worker per core
+
+        Each worker process loads the vector database once (via the pool
+        initializer) and then handles reports from the queue, so the
+        regex/embedding work parallelizes across cores instead of serializing
+        on the GIL. Single-path batches stay in-process.
+        """
+        if len(pdf_paths) <= 1:
+            return [
+                self.extract_to_required_format(self.extract_from_pdf(path),
+                                                report_id=path)
+                for path in pdf_paths
+            ]
+
+        max_workers = min(len(pdf_paths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.use_gemini,)) as pool:
+            return list(pool.map(_extract_one, pdf_paths))
+
     def extract_to_required_format_regex(self, text: str) -> Dict[str, List[str]]:
         """Regex-based extraction (fallback method)"""
-        # Get ICD and CPT codes first
-        icd_code_list = self.extract_icd_codes(text)
-        cpt_code_list = self.extract_cpt_codes(text)
+        # Get ICD and CPT codes first, sharing one sections parse
+        sections = utils.extract_sections(text)
+        icd_code_list = self.extract_icd_codes(text, sections=sections)
+        cpt_code_list = self.extract_cpt_codes(text, sections=sections)
         
         # Extract ICD codes as strings
         icd_10_codes = []
@@ -689,11 +764,12 @@ Clinical Report Text:
         # Extract HCPCS codes
         hcpcs_codes = self.extract_hcpcs_codes(text)
         
-        # Extract other required fields
+        # Extract other required fields (lowercase the report once, not per method)
+        text_lc = text.lower()
         clinical_terms = self.extract_clinical_terms(text)
-        anatomical_locations = self.extract_anatomical_locations(text)
-        diagnosis_descriptions = self.extract_diagnosis_descriptions(text, icd_code_list)
-        procedure_descriptions = self.extract_procedure_descriptions(text)
+        anatomical_locations = self.extract_anatomical_locations(text, text_lc=text_lc)
+        diagnosis_descriptions = self.extract_diagnosis_descriptions(text, icd_code_list, text_lc=text_lc)
+        procedure_descriptions = self.extract_procedure_descriptions(text, text_lc=text_lc)
         
         # Build result in required format
         result = {
@@ -708,3 +784,16 @@ Clinical Report Text:
         
         return result
 
+
+# Worker-process state for ClinicalReportExtractor.extract_many: the
+# extractor (vector DB + embedding model) is built once per worker by the
+# pool initializer, not once per report
+_worker_extractor = None
+
+def _init_worker(use_gemini):
+    global _worker_extractor
+    _worker_extractor = ClinicalReportExtractor(use_gemini=use_gemini)
+
+def _extract_one(pdf_path):
+    text = _worker_extractor.extract_from_pdf(pdf_path)
+    return _worker_extractor.extract_to_required_format(text, report_id=pdf_path)
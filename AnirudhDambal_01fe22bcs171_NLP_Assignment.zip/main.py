@@ -12,6 +12,8 @@ import sys
 import os
 import argparse
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 # Add current directory to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -25,10 +27,12 @@ import utils
 
 def build_vector_databases(vector_db):
     """Build or load vector databases for ICD and CPT codes"""
-    icd_db_path = os.path.join(config.VECTOR_DB_DIR, 'icd_vector_db.pkl')
-    cpt_db_path = os.path.join(config.VECTOR_DB_DIR, 'cpt_vector_db.pkl')
-    
-    if not os.path.exists(icd_db_path):
+    # Embeddings live in .npy memmaps with .json sidecars (legacy .pkl
+    # databases are still readable by the load_* methods)
+    icd_db_path = config.vector_db_path('icd_vector_db')
+    cpt_db_path = config.vector_db_path('cpt_vector_db')
+
+    if not (os.path.exists(icd_db_path + '.npy') or os.path.exists(icd_db_path + '.pkl')):
         print("[INFO] Building ICD vector database (this may take a few minutes)...")
         icd_count = vector_db.build_icd_database()
         print(f"[SUCCESS] Processed {icd_count} ICD codes\n")
@@ -37,7 +41,7 @@ def build_vector_databases(vector_db):
         vector_db.load_icd_database()
         print(f"[SUCCESS] Loaded {len(vector_db.icd_codes)} ICD codes\n")
     
-    if not os.path.exists(cpt_db_path):
+    if not (os.path.exists(cpt_db_path + '.npy') or os.path.exists(cpt_db_path + '.pkl')):
         print("[INFO] Building CPT vector database (this may take a few minutes)...")
         cpt_count = vector_db.build_cpt_database()
         print(f"[SUCCESS] Processed {cpt_count} CPT codes\n")
@@ -47,13 +51,14 @@ def build_vector_databases(vector_db):
         print(f"[SUCCESS] Loaded {len(vector_db.cpt_codes)} CPT codes\n")
 
 
+# Reports are separated by runs of blank lines; compiled once at import
+_REPORT_SPLIT_RE = re.compile(r'\n{3,}')
+
+
 def split_reports(text):
     """Split text into individual clinical reports"""
-    import re
-    # Split on multiple blank lines
-    reports = re.split(r'\n\n\n+', text)
     # Filter out very short segments (likely not reports)
-    reports = [r.strip() for r in reports if len(r.strip()) > 200]
+    reports = [r.strip() for r in _REPORT_SPLIT_RE.split(text) if len(r.strip()) > 200]
     return reports
 
 
@@ -115,22 +120,34 @@ def main(pdf_path=None):
     
     # Step 5: Extract Data
     print("\n[STEP 5] Extracting Structured Data...")
-    extracted_data = []
-    
-    for i, report_text in enumerate(reports[:4], 1):  # Process up to 4 reports
-        print(f"  Processing Report {i}...", end=" ")
+
+    def process_report(numbered):
+        i, report_text = numbered
         try:
             # Extract in required format
-            formatted_data = extractor.extract_to_required_format(report_text, report_id=f"report_{i}")
-            extracted_data.append(formatted_data)
-            print(f"[OK] (ICD: {len(formatted_data['ICD-10'])}, CPT: {len(formatted_data['CPT'])})")
+            return extractor.extract_to_required_format(report_text, report_id=f"report_{i}")
         except Exception as e:
-            print(f"[ERROR] {e}")
+            print(f"  [ERROR] Report {i}: {e}")
             import traceback
             traceback.print_exc()
+            return None
+
+    # Reports are independent and spend most of their time waiting on the
+    # Gemini API, so a small thread pool overlaps those calls; map() keeps
+    # results in report order
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(process_report, enumerate(reports[:4], 1)))
+
+    extracted_data = []
+    for i, formatted_data in enumerate(results, 1):
+        if formatted_data is None:
+            continue
+        extracted_data.append(formatted_data)
+        print(f"  Report {i}: [OK] (ICD: {len(formatted_data['ICD-10'])}, CPT: {len(formatted_data['CPT'])})")
     
     # Step 6: Save Results
     print(f"\n[STEP 6] Saving Results...")
+    config.ensure_output_dir()
     output_file = config.JSON_OUTPUT_FILE
     
     # Save JSON output
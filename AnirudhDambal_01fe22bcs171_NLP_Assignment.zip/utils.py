@@ -7,13 +7,57 @@ import numpy as np
 from typing import List, Dict, Tuple, Any
 import json
 
+# orjson serializes/parses several times faster than stdlib json and emits
+# bytes directly; fall back to stdlib when it isn't installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Patterns compiled once at import: the functions below run per report (and
+# per retry), so going through re's cache lookup each call adds up
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Common section headers, fused into one alternation (longest variant first
+# in each group): a single finditer pass locates every header, and section
+# bodies are sliced between successive headers instead of re-scanning the
+# whole report once per section
+_SECTION_HEADER_RE = re.compile(
+    r'\b(?:(?P<chief_complaint>chief complaint|cc)'
+    r'|(?P<history_of_present_illness>history of present illness|hpi)'
+    r'|(?P<review_of_systems>review of systems|ros)'
+    r'|(?P<physical_examination>physical examination|pe|exam)'
+    r'|(?P<assessment_and_plan>assessment and plan|a&p|assessment)'
+    r'|(?P<procedures>procedures performed|procedure[s]?)'
+    r'|(?P<diagnoses>final diagnosis|diagnoses|diagnosis))\b:?\s*',
+    re.IGNORECASE)
+
+# Common diagnosis patterns
+_DIAGNOSIS_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'(?:diagnosis|diagnoses|dx):\s*([^.\n]+)',
+        r'(?:icd[-\s]?10[:\s]+)([A-Z]\d{2}(?:\.\d+)?)',
+        r'([A-Z]\d{2}(?:\.\d+)?)',  # ICD-10 format codes in text
+    )
+]
+
+# Common procedure patterns
+_PROCEDURE_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'(?:procedure|procedure code|cpt):\s*([^.\n]+)',
+        r'(?:cpt[-\s]?code[:\s]+)(\d{5})',
+        r'(\d{5})',  # 5-digit CPT codes
+    )
+]
+
 def clean_text(text: str) -> str:
     """Clean and preprocess clinical text"""
     if not isinstance(text, str):
         return ""
-    
+
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE_RE.sub(' ', text)
     # Remove special characters but keep punctuation for clinical terms
     text = text.strip()
     return text
@@ -30,24 +74,20 @@ def extract_sections(text: str) -> Dict[str, str]:
         'diagnoses': ''
     }
     
-    text_lower = text.lower()
-    
-    # Common section headers
-    patterns = {
-        'chief_complaint': r'(?:chief complaint|cc):?\s*(.+?)(?=\n\n|\nhistory|$)',
-        'history_of_present_illness': r'(?:history of present illness|hpi):?\s*(.+?)(?=\n\n|\nreview|$)',
-        'review_of_systems': r'(?:review of systems|ros):?\s*(.+?)(?=\n\n|\nphysical|$)',
-        'physical_examination': r'(?:physical examination|pe|exam):?\s*(.+?)(?=\n\n|\nassessment|$)',
-        'assessment_and_plan': r'(?:assessment and plan|a&p|assessment):?\s*(.+?)(?=\n\n|\nprocedure|$)',
-        'procedures': r'(?:procedure[s]?|procedures performed):?\s*(.+?)(?=\n\n|\ndiagnosis|$)',
-        'diagnoses': r'(?:diagnosis|diagnoses|final diagnosis):?\s*(.+?)(?=\n\n|$)'
-    }
-    
-    for section, pattern in patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        if match:
-            sections[section] = clean_text(match.group(1))
-    
+    matches = list(_SECTION_HEADER_RE.finditer(text))
+    for i, match in enumerate(matches):
+        section = match.lastgroup
+        if sections[section]:
+            continue  # first occurrence wins, like the old per-section search
+        start = match.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[start:end]
+        # Section bodies stop at the first blank line, as before
+        cut = body.find('\n\n')
+        if cut != -1:
+            body = body[:cut]
+        sections[section] = clean_text(body)
+
     return sections
 
 def extract_clinical_entities(text: str) -> Dict[str, List[str]]:
@@ -59,26 +99,12 @@ def extract_clinical_entities(text: str) -> Dict[str, List[str]]:
         'body_parts': []
     }
     
-    # Common diagnosis patterns
-    diagnosis_patterns = [
-        r'(?:diagnosis|diagnoses|dx):\s*([^.\n]+)',
-        r'(?:icd[-\s]?10[:\s]+)([A-Z]\d{2}(?:\.\d+)?)',
-        r'([A-Z]\d{2}(?:\.\d+)?)',  # ICD-10 format codes in text
-    ]
-    
-    # Common procedure patterns
-    procedure_patterns = [
-        r'(?:procedure|procedure code|cpt):\s*([^.\n]+)',
-        r'(?:cpt[-\s]?code[:\s]+)(\d{5})',
-        r'(\d{5})',  # 5-digit CPT codes
-    ]
-    
-    for pattern in diagnosis_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
+    for pattern in _DIAGNOSIS_PATTERNS:
+        matches = pattern.findall(text)
         entities['diagnoses'].extend([clean_text(m) for m in matches])
-    
-    for pattern in procedure_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
+
+    for pattern in _PROCEDURE_PATTERNS:
+        matches = pattern.findall(text)
         entities['procedures'].extend([clean_text(m) for m in matches])
     
     # Remove duplicates while preserving order
@@ -98,11 +124,19 @@ def load_excel_data(file_path: str) -> pd.DataFrame:
 
 def save_json(data: Dict[str, Any], file_path: str):
     """Save data to JSON file with proper formatting"""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    if ORJSON_AVAILABLE:
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(
+                data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
 
 def load_json(file_path: str) -> Dict[str, Any]:
     """Load data from JSON file"""
+    if ORJSON_AVAILABLE:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
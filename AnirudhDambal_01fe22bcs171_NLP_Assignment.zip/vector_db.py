@@ -1,34 +1,253 @@
 """
 Vector Database for ICD and CPT Code Retrieval
 """
+import hashlib
+import json
 import pandas as pd
 import numpy as np
 import pickle
 import os
-from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
 from typing import List, Dict, Tuple
 import config
 
+# faiss is optional: when present, searches go through an ANN index instead
+# of the exhaustive numpy scan
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# onnxruntime is optional: with an int8 ONNX export of the embedding model
+# on disk, encoding runs through ORT's VNNI int8 kernels instead of PyTorch
+try:
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Bound on the per-instance query-embedding cache (see _embed_query); sized
+# to comfortably hold the unique clinical-term vocabulary of a large batch
+_QUERY_CACHE_MAX = 4096
+# HNSW graph degree: 32 is the usual accuracy/speed sweet spot for ~100K rows
+_HNSW_M = 32
+# Rows encoded per batch when building a database (see _encode_streaming)
+_ENCODE_CHUNK = 256
+
+
+def _save_db(base_path: str, codes: List[str], descriptions: List[str],
+             embeddings: np.ndarray):
+    """Persist a code database as a float16 memmap plus a JSON sidecar
+
+    Embeddings are L2-normalized and stored half-precision in a plain .npy
+    file written through open_memmap, so loads can mmap it instead of
+    deserializing a pickle blob; codes/descriptions go to a small JSON file
+    next to it.
+    """
+    # float16 input is the _encode_streaming contract: already normalized,
+    # so skip the float32 round trip
+    embeddings = np.asarray(embeddings)
+    if embeddings.dtype != np.float16:
+        embeddings = embeddings.astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    out = np.lib.format.open_memmap(base_path + '.npy', mode='w+',
+                                    dtype=np.float16, shape=embeddings.shape)
+    out[:] = embeddings
+    out.flush()
+    with open(base_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'codes': codes, 'descriptions': descriptions}, f)
+
+
+def _load_db(base_path: str):
+    """Load a code database saved by _save_db
+
+    Returns (codes, descriptions, embeddings) with the embeddings memory-
+    mapped read-only — the OS pages rows in lazily, so "loading" is
+    effectively free. Falls back to the legacy pickle format when only that
+    exists, normalizing its embeddings to match the new on-disk contract.
+    Returns None if neither file is present.
+    """
+    if os.path.exists(base_path + '.npy'):
+        with open(base_path + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        embeddings = np.load(base_path + '.npy', mmap_mode='r')
+        # Object arrays so search can fancy-index hits in one C call
+        return (np.asarray(meta['codes'], dtype=object),
+                np.asarray(meta['descriptions'], dtype=object),
+                embeddings)
+
+    legacy = base_path + '.pkl'
+    if os.path.exists(legacy):
+        with open(legacy, 'rb') as f:
+            data = pickle.load(f)
+        embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (np.asarray(data['codes'], dtype=object),
+                np.asarray(data['descriptions'], dtype=object),
+                embeddings)
+
+    return None
+
+
+def _encode_streaming(model, codes, descriptions):
+    """Encode "code description" strings chunk-by-chunk into one float16 array
+
+    Building the full searchable-text list up front keeps tens of thousands
+    of Python strings alive next to the embeddings during encoding. Here only
+    one _ENCODE_CHUNK-sized batch of strings exists at a time, and each
+    encoded chunk is normalized and written straight into the preallocated
+    half-precision output.
+    """
+    n = len(codes)
+    out = None
+    for start in range(0, n, _ENCODE_CHUNK):
+        # C-level "code desc" concatenation; done per chunk so only one
+        # fixed-width string array exists at a time
+        batch = np.char.add(
+            np.char.add(
+                np.asarray(codes[start:start + _ENCODE_CHUNK], dtype=str), ' '),
+            np.asarray(descriptions[start:start + _ENCODE_CHUNK], dtype=str)
+        ).tolist()
+        emb = np.asarray(model.encode(batch), dtype=np.float32)
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+        if out is None:
+            out = np.empty((n, emb.shape[1]), dtype=np.float16)
+        out[start:start + len(batch)] = emb
+    return out
+
+
+def _build_index(base_path: str, embeddings):
+    """Build and persist an HNSW index over normalized embeddings
+
+    Inner product over unit vectors equals cosine similarity, so queries
+    become O(log N) graph walks instead of an exhaustive scan. No-op when
+    faiss isn't installed; callers fall back to the numpy path.
+    """
+    if not FAISS_AVAILABLE:
+        return None
+    index = faiss.IndexHNSWFlat(embeddings.shape[1], _HNSW_M,
+                                faiss.METRIC_INNER_PRODUCT)
+    index.add(np.asarray(embeddings, dtype=np.float32))
+    faiss.write_index(index, base_path + '.faiss')
+    return index
+
+
+def _load_index(base_path: str):
+    """Load a previously built HNSW index, or None if unavailable"""
+    if FAISS_AVAILABLE and os.path.exists(base_path + '.faiss'):
+        return faiss.read_index(base_path + '.faiss')
+    return None
+
+
+class _OnnxEncoder:
+    """encode()-compatible wrapper over an int8 ONNX export of the model
+
+    Expects a directory holding model.onnx plus the tokenizer files — the
+    layout produced by `optimum-cli export onnx --task feature-extraction`
+    followed by onnxruntime.quantization.quantize_dynamic. The
+    InferenceSession is built once here and reused for every call; output
+    matches SentenceTransformer.encode (mean-pooled, optionally normalized).
+    """
+
+    def __init__(self, model_dir: str):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, 'model.onnx'),
+            providers=['CPUExecutionProvider'])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size: int = 64,
+               normalize_embeddings: bool = False, **_ignored):
+        chunks = []
+        for start in range(0, len(sentences), batch_size):
+            batch = list(sentences[start:start + batch_size])
+            enc = self.tokenizer(batch, padding=True, truncation=True,
+                                 return_tensors='np')
+            hidden = self.session.run(
+                None, {k: v for k, v in enc.items() if k in self._input_names})[0]
+            # Mean pooling over non-padding tokens, like the MiniLM ST head
+            mask = enc['attention_mask'][..., None].astype(hidden.dtype)
+            chunks.append((hidden * mask).sum(axis=1)
+                          / np.maximum(mask.sum(axis=1), 1e-9))
+        out = np.concatenate(chunks) if chunks else np.empty((0, 384), dtype=np.float32)
+        if normalize_embeddings:
+            out = out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
 class CodeVectorDB:
     """Vector database for medical code retrieval"""
     
     def __init__(self, embedding_model: str = None):
         """Initialize the vector database"""
         self.embedding_model_name = embedding_model or config.EMBEDDING_MODEL
-        self.model = SentenceTransformer(self.embedding_model_name)
+        self._explicit_model = embedding_model
+        self._model = None
         self.icd_codes = []
         self.icd_descriptions = []
         self.icd_embeddings = None
+        self.icd_index = None
         self.cpt_codes = []
         self.cpt_descriptions = []
         self.cpt_embeddings = None
-        
+        self.cpt_index = None
+        self._query_cache = OrderedDict()
+
+    @property
+    def model(self):
+        """Embedding model, created on first use
+
+        Instantiating it drags in torch (seconds of import time, hundreds
+        of MB of weights); runs that stick to regex extraction or only load
+        a prebuilt database never pay that cost.
+        """
+        if self._model is None:
+            if self._explicit_model is not None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self._explicit_model)
+            elif ONNX_AVAILABLE and os.path.isdir(config.ONNX_MODEL_DIR):
+                # int8 ONNX export present: encode through onnxruntime
+                self._model = _OnnxEncoder(config.ONNX_MODEL_DIR)
+            else:
+                # Shared quantized model cached under VECTOR_DB_DIR (see config.get_embedder)
+                self._model = config.get_embedder()
+        return self._model
+
+    def _embed_query(self, query_text: str):
+        """Encode a single query, reusing recent results
+
+        The same section text is searched against both the ICD and the CPT
+        database, and the same clinical terms ("chest pain", "hypertension")
+        recur across reports, so a bounded LRU collapses those repeats into
+        one transformer pass each. Keys are whitespace/case-normalized so
+        trivial formatting variants of a term share an entry; long texts key
+        on a sha1 digest to keep the cache dict compact.
+        """
+        key = ' '.join(query_text.split()).lower()
+        if len(key) >= 256:
+            key = hashlib.sha1(key.encode()).hexdigest()
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+        # Unit-length float16, matching the stored embeddings: similarity is
+        # then a plain dot product with no norm terms
+        embedding = self.model.encode(
+            [query_text], normalize_embeddings=True
+        )[0].astype(np.float16)
+        self._query_cache[key] = embedding
+        if len(self._query_cache) > _QUERY_CACHE_MAX:
+            self._query_cache.popitem(last=False)
+        return embedding
+
     def build_icd_database(self, icd_file: str = None):
         """Build vector database from ICD codes Excel file"""
         icd_file = icd_file or config.ICD_FILE
         print(f"Loading ICD codes from {icd_file}...")
-        
-        df = pd.read_excel(icd_file)
+
+        df = config.load_codes(icd_file)
         
         # Handle different possible column names
         code_col = None
@@ -48,33 +267,30 @@ class CodeVectorDB:
         
         self.icd_codes = df[code_col].astype(str).tolist()
         self.icd_descriptions = df[desc_col].astype(str).tolist()
-        
-        # Create searchable text: code + description
-        searchable_texts = [
-            f"{code} {desc}" for code, desc in zip(self.icd_codes, self.icd_descriptions)
-        ]
-        
-        print(f"Generating embeddings for {len(searchable_texts)} ICD codes...")
-        self.icd_embeddings = self.model.encode(searchable_texts, show_progress_bar=True)
-        
-        # Save to disk
-        icd_db_path = os.path.join(config.VECTOR_DB_DIR, 'icd_vector_db.pkl')
-        with open(icd_db_path, 'wb') as f:
-            pickle.dump({
-                'codes': self.icd_codes,
-                'descriptions': self.icd_descriptions,
-                'embeddings': self.icd_embeddings
-            }, f)
-        
-        print(f"ICD vector database saved to {icd_db_path}")
+
+        # Encode "code description" text in streamed chunks
+        print(f"Generating embeddings for {len(self.icd_codes)} ICD codes...")
+        embeddings = _encode_streaming(self.model, self.icd_codes,
+                                       self.icd_descriptions)
+
+        # Save to disk (normalized float16 memmap + JSON sidecar)
+        config.ensure_vector_db_dir()
+        icd_db_path = config.vector_db_path('icd_vector_db')
+        _save_db(icd_db_path, self.icd_codes, self.icd_descriptions, embeddings)
+        self.icd_codes = np.asarray(self.icd_codes, dtype=object)
+        self.icd_descriptions = np.asarray(self.icd_descriptions, dtype=object)
+        self.icd_embeddings = np.load(icd_db_path + '.npy', mmap_mode='r')
+        self.icd_index = _build_index(icd_db_path, self.icd_embeddings)
+
+        print(f"ICD vector database saved to {icd_db_path}.npy")
         return len(self.icd_codes)
     
     def build_cpt_database(self, cpt_file: str = None):
         """Build vector database from CPT codes Excel file"""
         cpt_file = cpt_file or config.CPT_FILE
         print(f"Loading CPT codes from {cpt_file}...")
-        
-        df = pd.read_excel(cpt_file)
+
+        df = config.load_codes(cpt_file)
         
         # Handle different possible column names
         code_col = None
@@ -94,53 +310,110 @@ class CodeVectorDB:
         
         self.cpt_codes = df[code_col].astype(str).tolist()
         self.cpt_descriptions = df[desc_col].astype(str).tolist()
-        
-        # Create searchable text: code + description
-        searchable_texts = [
-            f"{code} {desc}" for code, desc in zip(self.cpt_codes, self.cpt_descriptions)
-        ]
-        
-        print(f"Generating embeddings for {len(searchable_texts)} CPT codes...")
-        self.cpt_embeddings = self.model.encode(searchable_texts, show_progress_bar=True)
-        
-        # Save to disk
-        cpt_db_path = os.path.join(config.VECTOR_DB_DIR, 'cpt_vector_db.pkl')
-        with open(cpt_db_path, 'wb') as f:
-            pickle.dump({
-                'codes': self.cpt_codes,
-                'descriptions': self.cpt_descriptions,
-                'embeddings': self.cpt_embeddings
-            }, f)
-        
-        print(f"CPT vector database saved to {cpt_db_path}")
+
+        # Encode "code description" text in streamed chunks
+        print(f"Generating embeddings for {len(self.cpt_codes)} CPT codes...")
+        embeddings = _encode_streaming(self.model, self.cpt_codes,
+                                       self.cpt_descriptions)
+
+        # Save to disk (normalized float16 memmap + JSON sidecar)
+        config.ensure_vector_db_dir()
+        cpt_db_path = config.vector_db_path('cpt_vector_db')
+        _save_db(cpt_db_path, self.cpt_codes, self.cpt_descriptions, embeddings)
+        self.cpt_codes = np.asarray(self.cpt_codes, dtype=object)
+        self.cpt_descriptions = np.asarray(self.cpt_descriptions, dtype=object)
+        self.cpt_embeddings = np.load(cpt_db_path + '.npy', mmap_mode='r')
+        self.cpt_index = _build_index(cpt_db_path, self.cpt_embeddings)
+
+        print(f"CPT vector database saved to {cpt_db_path}.npy")
         return len(self.cpt_codes)
     
     def load_icd_database(self):
         """Load ICD vector database from disk"""
-        icd_db_path = os.path.join(config.VECTOR_DB_DIR, 'icd_vector_db.pkl')
-        if os.path.exists(icd_db_path):
-            with open(icd_db_path, 'rb') as f:
-                data = pickle.load(f)
-                self.icd_codes = data['codes']
-                self.icd_descriptions = data['descriptions']
-                self.icd_embeddings = data['embeddings']
+        icd_db_path = config.vector_db_path('icd_vector_db')
+        loaded = _load_db(icd_db_path)
+        if loaded is not None:
+            self.icd_codes, self.icd_descriptions, self.icd_embeddings = loaded
+            self.icd_index = _load_index(icd_db_path)
             print(f"Loaded {len(self.icd_codes)} ICD codes from database")
         else:
-            print(f"ICD database not found at {icd_db_path}. Please build it first.")
-    
+            print(f"ICD database not found at {icd_db_path}.npy. Please build it first.")
+
     def load_cpt_database(self):
         """Load CPT vector database from disk"""
-        cpt_db_path = os.path.join(config.VECTOR_DB_DIR, 'cpt_vector_db.pkl')
-        if os.path.exists(cpt_db_path):
-            with open(cpt_db_path, 'rb') as f:
-                data = pickle.load(f)
-                self.cpt_codes = data['codes']
-                self.cpt_descriptions = data['descriptions']
-                self.cpt_embeddings = data['embeddings']
+        cpt_db_path = config.vector_db_path('cpt_vector_db')
+        loaded = _load_db(cpt_db_path)
+        if loaded is not None:
+            self.cpt_codes, self.cpt_descriptions, self.cpt_embeddings = loaded
+            self.cpt_index = _load_index(cpt_db_path)
             print(f"Loaded {len(self.cpt_codes)} CPT codes from database")
         else:
-            print(f"CPT database not found at {cpt_db_path}. Please build it first.")
+            print(f"CPT database not found at {cpt_db_path}.npy. Please build it first.")
     
+    def _search_batch(self, embeddings, codes, descriptions, queries,
+                      top_k: int, threshold: float) -> List[List[Dict]]:
+        """Search many queries at once: one encoder batch + one matrix product
+
+        instead of a transformer forward pass and similarity scan per query.
+        Duplicate queries (the same code or term mentioned repeatedly in a
+        report) are collapsed with np.unique before encoding, so encoder and
+        GEMM cost scale with the unique-query count.
+        """
+        uniq, inverse = np.unique(np.asarray(queries, dtype=object),
+                                  return_inverse=True)
+        query_embeddings = np.asarray(
+            self.model.encode(list(uniq), batch_size=64,
+                              normalize_embeddings=True)
+        )
+
+        # Stored rows and queries are both unit-length, so the cosine matrix
+        # (shape N x U) is a single GEMM with no norm recomputation
+        sims = embeddings @ query_embeddings.T
+
+        uniq_results = []
+        for col in range(sims.shape[1]):
+            similarities = sims[:, col]
+            if top_k < similarities.size:
+                idx = np.argpartition(-similarities, top_k)[:top_k]
+            else:
+                idx = np.arange(similarities.size)
+            idx = idx[similarities[idx] >= threshold]
+            top_indices = idx[np.argsort(-similarities[idx])]
+
+            scores = similarities[top_indices].tolist()
+            uniq_results.append([
+                {'code': code, 'description': desc, 'similarity_score': score}
+                for code, desc, score in zip(codes[top_indices],
+                                             descriptions[top_indices], scores)
+            ])
+
+        # Scatter unique results back to the original query order
+        return [uniq_results[j] for j in inverse]
+
+    def search_icd_batch(self, queries: List[str], top_k: int = 5,
+                         threshold: float = 0.5) -> List[List[Dict]]:
+        """Search for matching ICD codes for a batch of queries"""
+        if self.icd_embeddings is None:
+            self.load_icd_database()
+
+        if self.icd_embeddings is None or not queries:
+            return [[] for _ in queries]
+
+        return self._search_batch(self.icd_embeddings, self.icd_codes,
+                                  self.icd_descriptions, queries, top_k, threshold)
+
+    def search_cpt_batch(self, queries: List[str], top_k: int = 5,
+                         threshold: float = 0.5) -> List[List[Dict]]:
+        """Search for matching CPT codes for a batch of queries"""
+        if self.cpt_embeddings is None:
+            self.load_cpt_database()
+
+        if self.cpt_embeddings is None or not queries:
+            return [[] for _ in queries]
+
+        return self._search_batch(self.cpt_embeddings, self.cpt_codes,
+                                  self.cpt_descriptions, queries, top_k, threshold)
+
     def search_icd(self, query_text: str, top_k: int = 5, threshold: float = 0.5) -> List[Dict]:
         """Search for matching ICD codes"""
         if self.icd_embeddings is None:
@@ -148,28 +421,46 @@ class CodeVectorDB:
         
         if self.icd_embeddings is None:
             return []
-        
-        # Encode query
-        query_embedding = self.model.encode([query_text])[0]
-        
-        # Calculate cosine similarity
-        similarities = np.dot(self.icd_embeddings, query_embedding) / (
-            np.linalg.norm(self.icd_embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
-        
-        # Get top-k results
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        results = []
-        for idx in top_indices:
-            if similarities[idx] >= threshold:
-                results.append({
-                    'code': self.icd_codes[idx],
-                    'description': self.icd_descriptions[idx],
-                    'similarity_score': float(similarities[idx])
-                })
-        
-        return results
+
+        # Encode query (cached across repeated searches of the same text)
+        query_embedding = self._embed_query(query_text)
+
+        # ANN fast path: O(log N) HNSW graph walk when the index exists
+        if self.icd_index is not None:
+            scores, ids = self.icd_index.search(
+                np.asarray(query_embedding, dtype=np.float32)[None, :], top_k)
+            return [
+                {
+                    'code': self.icd_codes[i],
+                    'description': self.icd_descriptions[i],
+                    'similarity_score': float(s)
+                }
+                for s, i in zip(scores[0], ids[0])
+                if i != -1 and s >= threshold
+            ]
+
+        # Rows are normalized at build/load, so cosine similarity over the
+        # whole corpus is a single BLAS matrix-vector product
+        similarities = self.icd_embeddings @ query_embedding
+
+        # Top-k via O(N) partial selection; only the k survivors above the
+        # threshold get fully sorted
+        if top_k < similarities.size:
+            idx = np.argpartition(-similarities, top_k)[:top_k]
+        else:
+            idx = np.arange(similarities.size)
+        idx = idx[similarities[idx] >= threshold]
+        top_indices = idx[np.argsort(-similarities[idx])]
+
+        # Bulk conversions: one tolist() for the scores and one fancy-index
+        # per object array instead of per-element Python lookups
+        scores = similarities[top_indices].tolist()
+        codes_hit = self.icd_codes[top_indices]
+        descs_hit = self.icd_descriptions[top_indices]
+        return [
+            {'code': code, 'description': desc, 'similarity_score': score}
+            for code, desc, score in zip(codes_hit, descs_hit, scores)
+        ]
     
     def search_cpt(self, query_text: str, top_k: int = 5, threshold: float = 0.5) -> List[Dict]:
         """Search for matching CPT codes"""
@@ -178,26 +469,44 @@ class CodeVectorDB:
         
         if self.cpt_embeddings is None:
             return []
-        
-        # Encode query
-        query_embedding = self.model.encode([query_text])[0]
-        
-        # Calculate cosine similarity
-        similarities = np.dot(self.cpt_embeddings, query_embedding) / (
-            np.linalg.norm(self.cpt_embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
-        
-        # Get top-k results
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        results = []
-        for idx in top_indices:
-            if similarities[idx] >= threshold:
-                results.append({
-                    'code': self.cpt_codes[idx],
-                    'description': self.cpt_descriptions[idx],
-                    'similarity_score': float(similarities[idx])
-                })
-        
-        return results
+
+        # Encode query (cached across repeated searches of the same text)
+        query_embedding = self._embed_query(query_text)
+
+        # ANN fast path: O(log N) HNSW graph walk when the index exists
+        if self.cpt_index is not None:
+            scores, ids = self.cpt_index.search(
+                np.asarray(query_embedding, dtype=np.float32)[None, :], top_k)
+            return [
+                {
+                    'code': self.cpt_codes[i],
+                    'description': self.cpt_descriptions[i],
+                    'similarity_score': float(s)
+                }
+                for s, i in zip(scores[0], ids[0])
+                if i != -1 and s >= threshold
+            ]
+
+        # Rows are normalized at build/load, so cosine similarity over the
+        # whole corpus is a single BLAS matrix-vector product
+        similarities = self.cpt_embeddings @ query_embedding
+
+        # Top-k via O(N) partial selection; only the k survivors above the
+        # threshold get fully sorted
+        if top_k < similarities.size:
+            idx = np.argpartition(-similarities, top_k)[:top_k]
+        else:
+            idx = np.arange(similarities.size)
+        idx = idx[similarities[idx] >= threshold]
+        top_indices = idx[np.argsort(-similarities[idx])]
+
+        # Bulk conversions: one tolist() for the scores and one fancy-index
+        # per object array instead of per-element Python lookups
+        scores = similarities[top_indices].tolist()
+        codes_hit = self.cpt_codes[top_indices]
+        descs_hit = self.cpt_descriptions[top_indices]
+        return [
+            {'code': code, 'description': desc, 'similarity_score': score}
+            for code, desc, score in zip(codes_hit, descs_hit, scores)
+        ]
 